@@ -1,22 +1,57 @@
 #!/usr/bin/env python
 
+import importlib as _importlib
 import warnings as _warnings
 
-from . import (  # NOQA
-    calibration,
-    cleaning,
-    flo_functions,
-    load,
-    mapping,
-    optics,
-    physics,
-    utils,
-)
 from .helpers import package_version
-from .mapping import grid_data, interp_obj
 from .plot import logo as make_logo
 from .plot import plot_functions as plot
-from .processing import *
+
+
+# submodules and top level functions are only imported on first access
+# (PEP 562), so that ``import glidertools`` does not pull in matplotlib,
+# xarray, netCDF4, etc. up front. ``plot`` is imported eagerly because the
+# package attribute is the plot_functions class, not the submodule.
+_SUBMODULES = {
+    "calibration",
+    "cleaning",
+    "flo_functions",
+    "load",
+    "mapping",
+    "optics",
+    "physics",
+    "processing",
+    "utils",
+}
+_ATTRIBUTES = {
+    "grid_data": "mapping",
+    "interp_obj": "mapping",
+    "calc_physics": "processing",
+    "oxygen_ml_per_l_to_umol_per_kg": "processing",
+    "calc_oxygen": "processing",
+    "calc_backscatter": "processing",
+    "calc_fluorescence": "processing",
+    "calc_par": "processing",
+}
+# a new public function in processing.py must be added to _ATTRIBUTES,
+# tests/test_imports.py checks that none is missing
+__all__ = sorted(_SUBMODULES | set(_ATTRIBUTES) | {"make_logo", "plot"})
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        value = _importlib.import_module("." + name, __name__)
+    elif name in _ATTRIBUTES:
+        module = _importlib.import_module("." + _ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES | set(_ATTRIBUTES))
 
 
 __version__ = package_version()
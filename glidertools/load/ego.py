@@ -31,6 +31,6 @@ def load_mission_nc(filename):
         press = xds.PRES.load()
         phase = calc_dive_phase(time, press)
 
-    xds["DIVES"] = dive_phase_to_number(phase)
+    xds["DIVES"] = xds.TIME.dims, dive_phase_to_number(phase)
 
     return xds
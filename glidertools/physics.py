@@ -10,7 +10,9 @@ from .helpers import GliderToolsWarning, transfer_nc_attrs
 from .utils import group_by_profiles
 
 
-def mixed_layer_depth(ds, variable, thresh=0.01, ref_depth=10, verbose=True):
+def mixed_layer_depth(
+    ds, variable, thresh=0.01, ref_depth=10, verbose=True, cache=False
+):
     """
     Calculates the MLD for ungridded glider array.
 
@@ -26,6 +28,9 @@ def mixed_layer_depth(ds, variable, thresh=0.01, ref_depth=10, verbose=True):
     ref_depth : float=10 reference depth for difference
     return_as_mask : bool, optional
     verbose : bool, optional
+    cache : bool, optional
+        reuse the grouped profiles of ds between calls, see
+        utils.group_by_profiles. Only for data not modified in place.
 
     Return
     ------
@@ -33,7 +38,7 @@ def mixed_layer_depth(ds, variable, thresh=0.01, ref_depth=10, verbose=True):
         will be an array of depths the length of the
         number of unique dives.
     """
-    groups = group_by_profiles(ds, [variable, "depth"])
+    groups = group_by_profiles(ds, [variable, "depth"], cache=cache)
     mld = groups.apply(mld_profile, variable, thresh, ref_depth, verbose)
     return mld
 
@@ -1,10 +1,38 @@
 #!/usr/bin/env python
 
+import weakref
+
 from inspect import currentframe as getframe
 
 from .helpers import transfer_nc_attrs
 
 
+# grouped profiles per dataset, {id(ds): {variables: (source, groups)}}
+_GROUPBY_CACHE = {}
+
+
+def _dive_runs(dives):
+    """
+    Boundaries of the runs of equal consecutive values in dives. No order
+    of the values is assumed: a dive that is interrupted by another one
+    spans several runs.
+
+    Parameters
+    ----------
+    dives : np.array, shape=[n, ]
+        dive numbers or labels
+
+    Returns
+    -------
+    bounds : np.array, dtype=int, shape=[n_runs + 1, ]
+        run i spans ``slice(bounds[i], bounds[i + 1])``
+    """
+    import numpy as np
+
+    changes = np.flatnonzero(dives[1:] != dives[:-1]) + 1
+    return np.r_[0, changes, dives.size]
+
+
 def time_average_per_dive(dives, time):
     """
     Gets the average time stamp per dive. This is used to create psuedo
@@ -24,27 +52,53 @@ def time_average_per_dive(dives, time):
         each dive will have the average time stamp of that dive. Can be used
         for plotting where time_average_per_dive is set as the x-axis.
     """
-    from numpy import array, datetime64, nanmean
-    from pandas import Series
+    import numpy as np
 
-    atime = array(time)
-    dives = array(dives)
-    if isinstance(atime[0], datetime64):
-        t = atime.astype("datetime64[s]").astype(float)
-    else:
-        t = atime
+    from pandas import factorize
 
-    t_grp = Series(t).groupby(dives)
-    t_mid = nanmean([t_grp.max(), t_grp.min()], axis=0)
-    t_ser = Series(t_mid, index=t_grp.mean().index.values)
-    diveavg = t_ser.reindex(index=dives).values
-    diveavg = diveavg.astype("datetime64[s]")
+    atime = np.array(time)
+    dives = np.array(dives)
+    is_datetime = atime.dtype.kind == "M"
+    if is_datetime:
+        # datetime64[s] is int64 underneath, so all reductions stay on the
+        # integers and no float copy of the times is needed
+        t = atime.astype("datetime64[s]").view(np.int64)
+        missing = np.isnat(atime)
+    else:
+        t = atime.astype(float)
+        missing = np.isnan(t)
+
+    # integer codes 0..n_dives-1 per sample (-1 for missing dives) from a
+    # single hash pass, so dives need not be numeric, sorted or monotonic
+    codes, uniques = factorize(dives)
+
+    # sorting by code makes each dive a contiguous run, so the per-dive
+    # min and max are single reduceat calls over the run boundaries;
+    # samples without a dive or a time are left out
+    order = np.argsort(codes, kind="stable")
+    order = order[(codes[order] >= 0) & ~missing[order]]
+    sorted_codes = codes[order]
+    sorted_t = t[order]
+    starts = _dive_runs(sorted_codes)[:-1] if order.size else order
+    t_min = np.minimum.reduceat(sorted_t, starts)
+    t_max = np.maximum.reduceat(sorted_t, starts)
+
+    # one slot per dive plus a last one that code -1 (no dive) points to;
+    # dives without any valid time stay NaT
+    if is_datetime:
+        per_dive = np.full(uniques.size + 1, np.datetime64("NaT").view(np.int64))
+        per_dive[sorted_codes[starts]] = t_min + (t_max - t_min) // 2
+        diveavg = per_dive[codes].view("datetime64[s]")
+    else:
+        per_dive = np.full(uniques.size + 1, np.nan)
+        per_dive[sorted_codes[starts]] = 0.5 * (t_min + t_max)
+        diveavg = per_dive[codes].astype("datetime64[s]")
     diveavg = transfer_nc_attrs(getframe(), time, diveavg, "_diveavg")
 
     return diveavg
 
 
-def group_by_profiles(ds, variables=None):
+def group_by_profiles(ds, variables=None, cache=False):
     """
     Group profiles by dives column. Each group member is one dive. The
     returned profiles can be evaluated statistically, e.g. by
@@ -55,21 +109,60 @@ def group_by_profiles(ds, variables=None):
     ----------
     ds : xarray.Dataset
         1-dimensional Glider dataset
-    variables : list of strings, optional
+    variables : str or list of strings, optional
         specify variables if only a subset of the dataset should be grouped
         into profiles. Grouping only a subset is considerably faster and more
-        memory-effective.
+        memory-effective. A single name returns the grouped pandas.Series.
+    cache : bool, optional
+        If True, the grouped profiles are kept for ds and returned again by
+        later calls with ``cache=True`` until one of the grouped variables
+        is replaced (e.g. ``ds["temp"] = ...``). Values changed in place
+        (e.g. ``ds.temp[:5] = np.nan``) are NOT detected, so only use this
+        for repeated calls on data that is not modified in between.
     Return
     ------
     profiles:
     dataset grouped by profiles (dives variable), as created by the
     pandas.groupby methods.
     """
-    ds = ds.reset_coords().to_pandas().reset_index().set_index("dives")
+    from pandas import DataFrame
+
+    single = isinstance(variables, str)
+    if single:
+        variables = [variables]
+
+    if cache:
+        key = (tuple(variables) if variables else None, single)
+        names = list(variables) if variables else list(ds.variables)
+        # the cache is only valid while the dataset holds the same variables
+        source = tuple(ds.variables[name] for name in names + ["dives"])
+
+        ds_cache = _GROUPBY_CACHE.get(id(ds))
+        if ds_cache is None:
+            ds_cache = _GROUPBY_CACHE[id(ds)] = {}
+            weakref.finalize(ds, _GROUPBY_CACHE.pop, id(ds), None)
+        elif key in ds_cache:
+            cached_source, groups = ds_cache[key]
+            if len(cached_source) == len(source) and all(
+                a is b for a, b in zip(cached_source, source)
+            ):
+                return groups
+
     if variables:
-        return ds[variables].groupby("dives")
+        # only the requested columns are copied out of the dataset
+        df = DataFrame({v: ds[v].values for v in variables})
+        df.index = ds["dives"].values
+        df.index.name = "dives"
+        groups = df.groupby("dives")
+        if single:
+            groups = groups[variables[0]]
     else:
-        return ds.groupby("dives")
+        df = ds.reset_coords().to_pandas().reset_index().set_index("dives")
+        groups = df.groupby("dives")
+
+    if cache:
+        ds_cache[key] = source, groups
+    return groups
 
 
 def mask_above_depth(ds, depths):
@@ -114,7 +207,7 @@ def mask_profile_depth(df, mask_depth, above):
         Mask either above mask_depth (True) or below (False)
     """
     if type(mask_depth) not in [int, float]:
-        # this case for calling from _mask_depth
+        # per-dive depths (e.g. from mixed_layer_depth) indexed by dive
         mask_depth = mask_depth.loc[df.index[0]]
     if above:
         mask = df.depth > mask_depth
@@ -124,13 +217,29 @@ def mask_profile_depth(df, mask_depth, above):
 
 
 def _mask_depth(ds, depths, above=True):
-    ds = ds.reset_coords().to_pandas().set_index("dives")
-    mask = ds.groupby("dives").apply(mask_profile_depth, depths, above)
-    # mask = mask if above else ~mask
-    return mask.values
+    import numpy as np
+
+    depth = ds["depth"].values
+    if np.ndim(depths) == 0:
+        mask_depth = depths
+    else:
+        # look up the per-dive depths (a hash lookup on the dive index, which
+        # need not be sorted) once per run of samples and repeat them over
+        # the run; dives without an entry are masked entirely
+        dives = ds["dives"].values
+        bounds = _dive_runs(dives)
+        idx = depths.index.get_indexer(dives[bounds[:-1]])
+        run_depth = np.where(idx >= 0, depths.values[idx], np.nan)
+        mask_depth = np.repeat(run_depth, np.diff(bounds))
+
+    if above:
+        mask = depth > mask_depth
+    else:
+        mask = depth < mask_depth
+    return mask
 
 
-def merge_dimensions(df1, df2, interp_lim=3):
+def merge_dimensions(df1, df2, interp_lim=3, method="linear"):
     """
     Merges variables measured at different time intervals. Glider data may be
     sampled at different time intervals, as is the case for primary CTD and
@@ -145,6 +254,15 @@ def merge_dimensions(df1, df2, interp_lim=3):
         A dataframe indexed by datetime64 sampling times. Can have multiple
         columns. This second dataframe will be interpolated linearly onto the
         first dataframe.
+    interp_lim : int, optional
+        The maximum number of consecutive samples that are filled.
+    method : str, optional
+        ``"linear"`` (default) interpolates df2 linearly onto the index of
+        df1 after an outer join. ``"nearest"`` is a faster, lighter sort-merge
+        (pandas.merge_asof) that takes the nearest sample of df2 within
+        ``interp_lim`` median sampling intervals of df2, without
+        interpolating between samples. If df2 has a single sample there is
+        no sampling interval, and that sample is used for every row of df1.
 
     Returns
     -------
@@ -153,6 +271,8 @@ def merge_dimensions(df1, df2, interp_lim=3):
 
     Raises
     ------
+    ValueError
+        If method is not ``"linear"`` or ``"nearest"``
     Userwarning
         If either one of the indicies are not datetime64 dtypes
 
@@ -172,8 +292,14 @@ def merge_dimensions(df1, df2, interp_lim=3):
     import numpy as np
     import xarray as xr
 
+    from pandas import isna, merge_asof
+
     from .helpers import GliderToolsError
 
+    if method not in ("linear", "nearest"):
+        msg = "method must be 'linear' or 'nearest', got {!r}".format(method)
+        raise ValueError(msg)
+
     is_xds = isinstance(df1, xr.Dataset) | isinstance(df2, xr.Dataset)
 
     if is_xds:
@@ -181,20 +307,40 @@ def merge_dimensions(df1, df2, interp_lim=3):
         raise GliderToolsError(msg)
 
     same_type = type(df1.index) == type(df2.index)  # noqa: E721
-    # turning datetime64[ns] to int64 first,
+    # turning datetime64[ns] to float ns first (NaT -> NaN),
     # because interpolate doesn't work on datetime-objects
 
-    if same_type:
+    if same_type and (method == "nearest"):
+        # the step is taken in time order, df2 need not be sorted
+        df2 = df2.sort_index()
+        step = df2.index.to_series().diff().median()
+        tolerance = None if isna(step) else interp_lim * step
+        if (tolerance is not None) and (df2.index.dtype.kind in "iu"):
+            # merge_asof only accepts an integer tolerance on integer indices
+            tolerance = int(np.ceil(tolerance))
+        df = merge_asof(
+            df1.sort_index(),
+            df2,
+            left_index=True,
+            right_index=True,
+            direction="nearest",
+            tolerance=tolerance,
+            suffixes=("", "_drop"),
+        )
+        return df.loc[df1.index]
+    elif same_type:
         df = df1.join(df2, sort=True, how="outer", rsuffix="_drop")
-        df.index = df1.index.astype(np.int64)
-        keys = df.select_dtypes(include=["datetime64[ns]"]).keys()
-        for key in keys:
-            df[key] = df[key].astype(np.int64)
+        keys = df.select_dtypes(include=["datetime64[ns]"]).columns
+        if len(keys) > 0:
+            # all datetime columns are cast as one block rather than per key
+            dt_block = df[keys].values
+            dt_float = dt_block.view(np.int64).astype(float)
+            dt_float[np.isnat(dt_block)] = np.nan
+            df[keys] = dt_float
         df = df.interpolate(limit=interp_lim).bfill(limit=interp_lim)
-        df.index = df1.index.astype("datetime64[ns]")
-        for key in keys:
-            df[key] = df[key].astype("datetime64[ns]")
-        return df.loc[df1.index.astype("datetime64[ns]")]
+        if len(keys) > 0:
+            df[keys] = df[keys].values.astype("datetime64[ns]")
+        return df.loc[df1.index]
     else:
         raise UserWarning("Both dataframe indicies need to be same dtype")
 
@@ -215,23 +361,97 @@ def calc_glider_vert_velocity(time, depth):
     velocity : np.array
         vertical velocity in cm/s
     """
-    from numpy import array
-    from pandas import Series
+    import numpy as np
 
-    # Converting time from datetime 64 to seconds since deployment
-    t_ns = array(time).astype("datetime64[ns]").astype(float)
-    t_s = Series((t_ns - t_ns.min()) / 1e9)
+    # time steps in seconds from the integer nanoseconds of datetime64
+    t_ns = np.asarray(time).astype("datetime64[ns]", copy=False).view(np.int64)
+    dt_s = np.diff(t_ns) * 1e-9
 
-    # converting pressure from dbar/m to cm
-    p_m = array(depth).astype(float)
-    p_cm = Series(p_m * 100)
+    # depth steps converted from dbar/m to cm
+    dp_cm = np.diff(np.asarray(depth, dtype=np.float64)) * 100.0
 
-    # velocity in cm/s
-    velocity = p_cm.diff() / t_s.diff()
+    # velocity in cm/s, the first sample has no preceding step
+    velocity = np.empty(t_ns.size)
+    velocity[0] = np.nan
+    velocity[1:] = dp_cm / dt_s
 
     return velocity
 
 
+def _apply_with_preceding(func, a, b, dim):
+    """
+    Applies func(a, b) to each 1-D slice of two xarray.DataArrays along dim,
+    where func only needs each sample and the one preceding it (e.g.
+    distance, calc_glider_vert_velocity). Dask-backed arrays are processed
+    chunk by chunk with one sample of overlap from the previous chunk, so the
+    result stays lazy and dim does not have to fit into memory.
+    """
+    import numpy as np
+    import xarray as xr
+
+    def apply_slices(a, b):
+        out = np.empty(a.shape)
+        for i in np.ndindex(a.shape[:-1]):
+            out[i] = func(a[i], b[i])
+        return out
+
+    def apply_chunks(a, b):
+        import dask.array as dsa
+
+        # dim is the last axis; each chunk gets the last sample of the chunk
+        # before it, which is dropped from the output again
+        return dsa.map_overlap(
+            apply_slices,
+            dsa.asarray(a),
+            dsa.asarray(b),
+            depth={a.ndim - 1: (1, 0)},
+            boundary="none",
+            dtype=np.float64,
+        )
+
+    is_dask = (a.chunks is not None) or (b.chunks is not None)
+    return xr.apply_ufunc(
+        apply_chunks if is_dask else apply_slices,
+        a,
+        b,
+        input_core_dims=[[dim], [dim]],
+        output_core_dims=[[dim]],
+        dask="allowed",
+    )
+
+
+def calc_glider_vert_velocity_xr(time, depth, dim=None):
+    """
+    Calculate glider vertical velocity in cm/s for xarray.DataArrays.
+    Unlike utils.calc_glider_vert_velocity, dask-backed arrays are not
+    loaded into memory; the result stays lazy and is computed chunk by
+    chunk.
+
+    Parameters
+    ----------
+    time : xarray.DataArray [datetime64]
+        glider time dimension
+    depth : xarray.DataArray [float]
+        depth (m) or pressure (dbar) if depth not avail
+    dim : str, optional
+        dimension along which the velocity is calculated. Defaults to the
+        only dimension of 1-D arrays.
+
+    Returns
+    -------
+    velocity : xarray.DataArray
+        vertical velocity in cm/s
+
+    Note
+    ----
+    Velocities are taken between neighbours along ``dim``, so each chunk
+    along ``dim`` also reads the last sample of the chunk before it.
+    """
+    dim = time.dims[0] if dim is None else dim
+
+    return _apply_with_preceding(calc_glider_vert_velocity, time, depth, dim)
+
+
 def calc_dive_phase(time, depth, dive_depth_threshold=15):
     """
     Determine the glider dive phase
@@ -247,26 +467,29 @@ def calc_dive_phase(time, depth, dive_depth_threshold=15):
 
     Returns
     -------
-    phase : np.array [int]
+    phase : np.array [int8]
         phase according to the EGO dive phases
     """
-    from numpy import array, isnan, ndarray
+    from numpy import array, int8, select
 
     time = array(time)
     depth = array(depth)
 
     velocity = calc_glider_vert_velocity(time, depth)  # cm/s
 
-    phase = ndarray(time.size)
-
-    phase[velocity > 0.5] = 1  # down dive
-    phase[velocity < -0.5] = 4  # up dive
-    phase[(depth > dive_depth_threshold) & (velocity >= -0.5) & (velocity <= 0.5)] = (
-        3  # inflexion
+    down = velocity > 0.5
+    up = velocity < -0.5
+    shallow = depth <= dive_depth_threshold
+    inflexion = (depth > dive_depth_threshold) & (velocity >= -0.5) & ~down
+
+    # first matching condition wins, anything unmatched (e.g. NaN) is 6;
+    # int8 choices keep the output at one byte per sample
+    phase = select(
+        [shallow, down, up, inflexion],
+        # surface drift, down dive, up dive, inflexion
+        [int8(0), int8(1), int8(4), int8(3)],
+        default=int8(6),
     )
-    phase[depth <= dive_depth_threshold] = 0  # surface drift
-    phase[isnan(phase)] = 6
-    phase = phase.astype(int)
 
     return phase
 
@@ -298,14 +521,17 @@ def calc_dive_number(time, depth, dive_depth_threshold=15):
 
 
 def dive_phase_to_number(phase):
-    from pandas import Series
-
-    phase = Series(phase)
+    import numpy as np
 
-    u_dive = ((phase == 4).astype(int).diff() == 1).astype(int).cumsum()
-    d_dive = ((phase == 1).astype(int).diff() == 1).astype(int).cumsum()
+    phase = np.asarray(phase)
+    is_down = phase == 1
+    is_up = phase == 4
 
-    dive = (u_dive + d_dive) / 2
+    # every start of a down or up phase begins the next half dive
+    starts = (is_down[1:] & ~is_down[:-1]) | (is_up[1:] & ~is_up[:-1])
+    dive = np.zeros(phase.size)
+    np.cumsum(starts, dtype=float, out=dive[1:])
+    dive /= 2
 
     return dive
 
@@ -330,10 +556,12 @@ def distance(lon, lat, ref_idx=None):
         or distance from reference point
 
     """
+    import numexpr as ne
     import numpy as np
 
-    lon = np.array(lon)
-    lat = np.array(lat)
+    # no copy when the input already is a float64 array
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
 
     earth_radius = 6371e3
 
@@ -344,8 +572,8 @@ def distance(lon, lat, ref_idx=None):
     if not len(lon.shape) == 1:
         raise ValueError("lon, lat must be flat arrays")
 
-    lon = np.radians(lon)
-    lat = np.radians(lat)
+    lon = np.deg2rad(lon)
+    lat = np.deg2rad(lat)
 
     if ref_idx is None:
         i1 = slice(0, -1)
@@ -359,18 +587,53 @@ def distance(lon, lat, ref_idx=None):
         dlon = lon[ref_idx] - lon
         dlat = lat[ref_idx] - lat
 
-    a = np.sin(dlat / 2) ** 2 + np.sin(dlon / 2) ** 2 * np.cos(lat[i1]) * np.cos(
-        lat[i2]
+    # haversine formula evaluated by numexpr to avoid the temporary
+    # arrays of the intermediate numpy operations
+    a = ne.evaluate(
+        "sin(dlat / 2)**2 + sin(dlon / 2)**2 * cos(lat1) * cos(lat2)",
+        local_dict=dict(dlat=dlat, dlon=dlon, lat1=lat[i1], lat2=lat[i2]),
+    )
+    # equivalent to 2 * arctan2(sqrt(a), sqrt(1 - a)) with one transcendental
+    # less; a is never negative, but rounding can push it marginally above 1,
+    # which is clamped in the same pass
+    distance = ne.evaluate(
+        "earth_radius * 2 * arcsin(sqrt(where(a > 1, 1, a)))",
+        local_dict=dict(earth_radius=earth_radius, a=a),
     )
-
-    angles = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-
-    distance = earth_radius * angles
     d = np.r_[0, distance]
 
     return d
 
 
+def distance_xr(lon, lat, dim=None):
+    """
+    Great-circle distance in m between adjacent lon, lat points of
+    xarray.DataArrays. Unlike utils.distance, dask-backed arrays are not
+    loaded into memory; the result stays lazy and is computed chunk by chunk.
+
+    Parameters
+    ----------
+    lon, lat : xarray.DataArray
+        Longitude, latitude, in degrees.
+    dim : str, optional
+        dimension along which adjacent points are taken. Defaults to the
+        only dimension of 1-D arrays.
+
+    Returns
+    -------
+    distance : xarray.DataArray
+        distance in meters between adjacent points
+
+    Note
+    ----
+    Distances are taken between neighbours along ``dim``, so each chunk
+    along ``dim`` also reads the last sample of the chunk before it.
+    """
+    dim = lon.dims[0] if dim is None else dim
+
+    return _apply_with_preceding(distance, lon, lat, dim)
+
+
 if __name__ == "__main__":
 
     pass
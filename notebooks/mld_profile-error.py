@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import xarray as xr
 import glidertools as gt
 
@@ -34,12 +35,15 @@ for i in os.listdir(nc_ngdac_path):
     ds_list.append(ds_tmp)
 ds = xr.concat(ds_list, dim="time")
 
-df = ds[['profile_id', 'profile_direction']].to_pandas()
-df['profile_id_dup'] = df.profile_id.duplicated(keep='first')
-df['profile_id_cumsum'] = df.profile_id_dup.eq(False).cumsum()
-df['dive'] = df.profile_id_cumsum / 2 + 0.5
+# profile_id increases monotonically, so a new profile starts wherever it
+# changes; one pass over the ids instead of duplicated/eq/cumsum
+pid = ds['profile_id'].values
+new_profile = np.empty(pid.size, dtype=bool)
+new_profile[0] = True
+np.not_equal(pid[1:], pid[:-1], out=new_profile[1:])
+dive = np.cumsum(new_profile, dtype=np.int32) / 2 + 0.5
 
-ds["dives"] = (["time"], df.dive)
+ds["dives"] = (["time"], dive)
 # ds
 
 ###
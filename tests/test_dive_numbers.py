@@ -1,3 +1,8 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
 import glidertools.utils as gt_util
 
 from glidertools.load import seaglider_basestation_netCDFs
@@ -13,8 +18,164 @@ dat = ds_dict["sg_data_point"]
 depth = dat["ctd_depth"]
 time = dat["ctd_time"]
 
+# df2 is sampled at every fourth time step of df1, starting at 5 s
+idx1 = pd.date_range("2020-01-01", periods=15, freq="5s")
+idx2 = pd.date_range("2020-01-01 00:00:05", periods=3, freq="20s")
+df1 = pd.DataFrame({"a": np.arange(15.0)}, index=idx1)
+df2 = pd.DataFrame({"b": [1.0, 2.0, 3.0], "t2": idx2}, index=idx2)
+
 
 def test_find_correct_number_dives():
     # using default values
     dives = gt_util.calc_dive_number(depth, time)
     assert dives.max() == 599.5
+
+
+def test_calc_dive_phase():
+    t = np.datetime64("2020-01-01T00:00:00") + np.arange(8) * np.timedelta64(10, "s")
+    d = np.array([20, 40, 60, 60, 40, 20, 10, np.nan])
+    phase = gt_util.calc_dive_phase(t, d)
+    # the first sample (no velocity) and the NaN depth match no phase
+    np.testing.assert_array_equal(phase, [6, 1, 1, 3, 4, 4, 0, 6])
+    assert phase.dtype == np.int8
+
+
+def test_time_average_per_dive():
+    dives = dat["dives"].values
+    t = dat["ctd_time_dt64"].values
+    tavg = gt_util.time_average_per_dive(dives, t)
+    for d in [304.0, 310.5, 317.5]:
+        i = dives == d
+        assert len(set(tavg[i])) == 1
+        assert t[i].min() <= tavg[i][0] <= t[i].max()
+
+
+def test_time_average_per_dive_unsorted_labels():
+    # string labels, with dive "b" interrupted by dive "a"
+    dives = np.array(["b", "b", "a", "a", "b", "c"])
+    t = np.datetime64("2020-01-01T00:00:00") + np.array(
+        [10, 20, 0, 4, 30, 50], dtype="timedelta64[s]"
+    )
+    tavg = gt_util.time_average_per_dive(dives, t)
+    expected = np.datetime64("2020-01-01T00:00:00") + np.array(
+        [20, 20, 2, 2, 20, 50], dtype="timedelta64[s]"
+    )
+    np.testing.assert_array_equal(tavg, expected)
+
+
+def test_time_average_per_dive_with_nat():
+    dives = np.array([1, 1, 1, 1, 2, 2])
+    t = np.datetime64("2020-01-01T00:00:00") + np.array(
+        [0, 0, 10, 0, 100, 0], dtype="timedelta64[s]"
+    )
+    t[[1, 3, 5]] = np.datetime64("NaT")
+    tavg = gt_util.time_average_per_dive(dives, t)
+    # NaT samples are ignored and still get the average of their dive
+    expected = np.datetime64("2020-01-01T00:00:00") + np.array(
+        [5, 5, 5, 5, 100, 100], dtype="timedelta64[s]"
+    )
+    np.testing.assert_array_equal(tavg, expected)
+
+
+def test_time_average_per_dive_empty():
+    tavg = gt_util.time_average_per_dive([], np.array([], dtype="datetime64[ns]"))
+    assert tavg.size == 0
+    assert tavg.dtype == "datetime64[s]"
+
+
+def test_vert_velocity_xr_matches_numpy():
+    t = dat["ctd_time_dt64"]
+    velocity = gt_util.calc_glider_vert_velocity(t, depth)
+    velocity_xr = gt_util.calc_glider_vert_velocity_xr(t, depth)
+    assert velocity_xr.dims == depth.dims
+    np.testing.assert_allclose(velocity_xr.values, velocity)
+
+
+def test_vert_velocity_xr_dask():
+    pytest.importorskip("dask")
+
+    t = dat["ctd_time_dt64"]
+    velocity = gt_util.calc_glider_vert_velocity(t, depth)
+    velocity_xr = gt_util.calc_glider_vert_velocity_xr(t.chunk(1000), depth.chunk(1000))
+    # still lazy, and chunk borders give the same velocities as in memory
+    assert velocity_xr.chunks is not None
+    np.testing.assert_allclose(velocity_xr.values, velocity)
+
+
+def test_distance_xr_dask():
+    pytest.importorskip("dask")
+
+    # a track along the equator and a meridian, one degree per sample
+    lon = np.r_[np.arange(50.0), np.full(50, 49.0)]
+    lat = np.r_[np.zeros(50), np.arange(1.0, 51.0)]
+    lon_xr = xr.DataArray(lon, dims="time").chunk(30)
+    lat_xr = xr.DataArray(lat, dims="time").chunk(30)
+
+    d = gt_util.distance_xr(lon_xr, lat_xr)
+    assert d.dims == lon_xr.dims
+    assert d.chunks is not None
+    np.testing.assert_allclose(d.values, gt_util.distance(lon, lat))
+    np.testing.assert_allclose(d.values[1:], 111195, rtol=1e-5)
+
+
+def test_distance():
+    # one degree of longitude at the equator
+    d = gt_util.distance([0, 1], [0, 0])
+    np.testing.assert_allclose(d, [0, 111195], rtol=1e-5)
+    # antipodal points (a is clipped to the arcsin domain)
+    d = gt_util.distance([0, 180], [0, 0])
+    np.testing.assert_allclose(d[1], 20015087, rtol=1e-6)
+    # distances from a reference point
+    d = gt_util.distance([0, 1, 2], [0, 0, 0], ref_idx=0)
+    np.testing.assert_allclose(d[1:], [0, 111195, 222390], rtol=1e-5)
+
+
+def test_merge_dimensions_interpolates_datetime_columns():
+    merged = gt_util.merge_dimensions(df1, df2)
+    assert (merged.index == idx1).all()
+    assert merged.t2.dtype == "datetime64[ns]"
+    # 00:00:15 lies halfway between the df2 samples at 00:00:05 and 00:00:25
+    assert merged.t2.iloc[3] == pd.Timestamp("2020-01-01 00:00:15")
+    assert merged.b.iloc[3] == 1.5
+    # the first sample is back-filled from the df2 sample at 00:00:05
+    assert merged.t2.iloc[0] == idx2[0]
+
+
+def test_merge_dimensions_nearest():
+    merged = gt_util.merge_dimensions(df1, df2, interp_lim=1, method="nearest")
+    assert (merged.index == idx1).all()
+    assert merged.b.iloc[0] == 1.0
+    assert merged.b.iloc[5] == 2.0
+    # only the last sample is more than one df2 interval (20 s) from df2
+    assert merged.b.isnull().sum() == 1
+    assert merged.b.isnull().iloc[-1]
+
+
+def test_merge_dimensions_nearest_unsorted():
+    merged = gt_util.merge_dimensions(
+        df1, df2.iloc[[2, 0, 1]], interp_lim=1, method="nearest"
+    )
+    expected = gt_util.merge_dimensions(df1, df2, interp_lim=1, method="nearest")
+    assert merged.equals(expected)
+
+
+def test_merge_dimensions_nearest_single_sample():
+    merged = gt_util.merge_dimensions(df1, df2.iloc[:1], method="nearest")
+    assert (merged.b == 1.0).all()
+
+
+def test_merge_dimensions_nearest_integer_index():
+    seconds1 = list(range(0, 75, 5))
+    seconds2 = [5, 25, 45]
+    merged = gt_util.merge_dimensions(
+        df1.set_axis(seconds1), df2.set_axis(seconds2), interp_lim=1, method="nearest"
+    )
+    assert (merged.index == seconds1).all()
+    assert merged.b.iloc[0] == 1.0
+    assert merged.b.isnull().sum() == 1
+    assert merged.b.isnull().iloc[-1]
+
+
+def test_merge_dimensions_unknown_method():
+    with pytest.raises(ValueError):
+        gt_util.merge_dimensions(df1, df2, method="cubic")
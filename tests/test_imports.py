@@ -4,6 +4,27 @@ def test_import():
     print(glidertools)
 
 
+def test_processing_functions_exported():
+    import inspect
+
+    import glidertools as gt
+
+    from glidertools import processing
+
+    for name, func in inspect.getmembers(processing, inspect.isfunction):
+        if name.startswith("_") or (func.__module__ != processing.__name__):
+            continue
+        assert getattr(gt, name) is func
+        assert name in gt.__all__
+
+
+def test_star_import():
+    namespace = {}
+    exec("from glidertools import *", namespace)
+    for name in ["calc_physics", "grid_data", "interp_obj", "plot", "utils"]:
+        assert name in namespace
+
+
 def test_import_data_seaglider():
     import glidertools as gt
 
@@ -7,7 +7,7 @@ from glidertools.physics import (
     potential_density,
     spice0,
 )
-from glidertools.utils import mask_above_depth, mask_below_depth
+from glidertools.utils import group_by_profiles, mask_above_depth, mask_below_depth
 
 
 filenames = "./tests/data/p542*.nc"
@@ -68,6 +68,54 @@ def test_masking():
     assert dat.depth[mask].max() < 40
 
 
+def test_masking_unsorted_depths_index():
+    import numpy as np
+    import pandas as pd
+
+    ds = xr.Dataset(
+        {
+            "depth": ("x", [5.0, 15.0, 5.0, 15.0, 5.0, 15.0, 5.0]),
+            "dives": ("x", [2.0, 2.0, 1.0, 1.0, 3.0, 3.0, 2.0]),
+        }
+    )
+    # per-dive depths whose index is neither sorted nor complete (no dive 3)
+    depths = pd.Series([10.0, 1.0], index=[2.0, 1.0])
+
+    above = mask_above_depth(ds, depths)
+    below = mask_below_depth(ds, depths)
+    # dive 3 has no depth, so it is excluded by both masks
+    np.testing.assert_array_equal(above, [0, 1, 1, 1, 0, 0, 0])
+    np.testing.assert_array_equal(below, [1, 0, 0, 0, 0, 0, 1])
+
+
+def test_group_by_profiles_single_variable():
+    groups = group_by_profiles(dat, "temp_raw")
+    means = groups.mean()
+    assert means.name == "temp_raw"
+    assert means.equals(group_by_profiles(dat, ["temp_raw"]).mean().temp_raw)
+
+
+def test_group_by_profiles_cache():
+    ds = dat[["temp_raw", "depth", "dives"]].copy()
+    groups = group_by_profiles(ds, ["temp_raw", "depth"], cache=True)
+    assert group_by_profiles(ds, ["temp_raw", "depth"], cache=True) is groups
+    # replacing a grouped variable invalidates the cached groups
+    ds["temp_raw"] = ds.temp_raw + 1
+    regrouped = group_by_profiles(ds, ["temp_raw", "depth"], cache=True)
+    assert regrouped is not groups
+    diff = regrouped.temp_raw.mean() - groups.temp_raw.mean()
+    assert abs(diff - 1).max() < 1e-9
+
+
+def test_group_by_profiles_in_place_edit():
+    ds = dat[["temp_raw", "depth", "dives"]].copy(deep=True)
+    before = group_by_profiles(ds, ["temp_raw"]).mean()
+    ds["temp_raw"].values[:] = 0
+    after = group_by_profiles(ds, ["temp_raw"]).mean()
+    assert (before.temp_raw != 0).any()
+    assert (after.temp_raw == 0).all()
+
+
 def test_potential_density():
     pot_den = potential_density(
         dat.salt_raw, dat.temp_raw, dat.pressure, dat.latitude, dat.longitude